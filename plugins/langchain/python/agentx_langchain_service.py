@@ -4,35 +4,46 @@ AgentX LangChain服务
 提供LangChain框架的HTTP API接口，供Rust插件调用
 """
 
+import ast
 import asyncio
+import functools
+import hashlib
+import importlib
+import importlib.util
 import json
 import logging
+import operator
 import os
 import sys
-from typing import Dict, List, Any, Optional
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Annotated, Dict, List, Any, Optional
 from datetime import datetime
+from urllib.parse import urlsplit
 
+import httpx
+import orjson
 import uvicorn
+from cachetools import LRUCache, TTLCache
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
+from starlette.routing import Route
 
-# LangChain imports
-try:
-    from langchain.llms import OpenAI
-    from langchain.chat_models import ChatOpenAI
-    from langchain.agents import initialize_agent, AgentType
+# LangChain按需导入，启动时只检查是否已安装
+if TYPE_CHECKING:
     from langchain.tools import Tool
-    from langchain.memory import ConversationBufferMemory
-    from langchain.chains import LLMChain, ConversationChain
-    from langchain.prompts import PromptTemplate
-    from langchain.schema import HumanMessage, AIMessage, SystemMessage
-    from langchain.callbacks.manager import CallbackManager
-    from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
-except ImportError as e:
-    print(f"错误: 无法导入LangChain模块: {e}")
-    print("请安装LangChain: pip install langchain langchain-community langchain-core")
-    sys.exit(1)
+
+for _package in ("langchain", "langchain_community", "langchain_core"):
+    if importlib.util.find_spec(_package) is None:
+        print(f"错误: 无法导入LangChain模块: {_package}")
+        print("请安装LangChain: pip install langchain langchain-community langchain-core")
+        sys.exit(1)
+
+@functools.cache
+def lazy_import(module_name: str, attr: str) -> Any:
+    """首次使用时导入模块属性，减少启动时间和每个worker的内存占用"""
+    return getattr(importlib.import_module(module_name), attr)
 
 # 配置日志
 logging.basicConfig(
@@ -41,11 +52,76 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 秒级缓存的当前时间字符串，由后台任务每秒刷新
+_now_iso = ""
+
+async def tick_timestamp():
+    """每秒刷新一次缓存的时间字符串"""
+    global _now_iso
+    while True:
+        _now_iso = datetime.now().isoformat(timespec="seconds")
+        await asyncio.sleep(1.0)
+
+def current_timestamp() -> str:
+    """获取当前时间字符串，后台任务未运行时直接计算"""
+    return _now_iso or datetime.now().isoformat(timespec="seconds")
+
+def redact_url(url: str) -> str:
+    """去掉URL中的用户名和密码，用于日志输出"""
+    parts = urlsplit(url)
+    netloc = parts.netloc.rpartition("@")[2]
+    if "@" in parts.netloc:
+        netloc = f"***@{netloc}"
+    query = "&".join(
+        item for item in parts.query.split("&")
+        if item and not item.lower().startswith("password=")
+    )
+    return parts._replace(netloc=netloc, query=query).geturl()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：创建并关闭全局共享的HTTP连接池和时间刷新任务"""
+    global _now_iso
+    state.http_client = httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=200, max_keepalive_connections=100),
+        timeout=60
+    )
+    # 多worker部署时通过Redis共享聊天响应缓存
+    redis_url = os.getenv("AGENTX_REDIS_URL")
+    if redis_url:
+        redis_asyncio = lazy_import("redis", "asyncio")
+        state.redis = redis_asyncio.from_url(
+            redis_url,
+            socket_timeout=REDIS_TIMEOUT,
+            socket_connect_timeout=REDIS_TIMEOUT
+        )
+        logger.info(f"使用Redis共享聊天缓存: {redact_url(redis_url)}")
+    tick_task = asyncio.create_task(tick_timestamp())
+    try:
+        yield
+    finally:
+        tick_task.cancel()
+        _now_iso = ""
+        if state.redis is not None:
+            # 等待后台写入完成后再关闭连接
+            await asyncio.gather(*_redis_write_tasks, return_exceptions=True)
+            await state.redis.aclose()
+            state.redis = None
+        # 已创建的模型、链和Agent绑定了即将关闭的连接池，一并清理，重启后按需重建
+        state.models.clear()
+        state.agents.clear()
+        _chat_batchers.clear()
+        _llm_chain_cache.clear()
+        await state.http_client.aclose()
+        state.http_client = None
+
 # FastAPI应用
 app = FastAPI(
     title="AgentX LangChain Service",
     description="LangChain框架HTTP API服务",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS中间件
@@ -62,14 +138,101 @@ class ServiceState:
     def __init__(self):
         self.agents: Dict[str, Any] = {}
         self.models: Dict[str, Any] = {}
-        self.tools: Dict[str, Tool] = {}
+        self.tools: Dict[str, "Tool"] = {}
         self.sessions: Dict[str, Any] = {}
+        self.http_client: Optional[httpx.AsyncClient] = None
+        self.redis: Optional[Any] = None
         self.initialized = False
 
 state = ServiceState()
 
+# 聊天请求微批处理：合并短时间窗口内同一模型的请求后批量分发
+class ChatBatcher:
+    def __init__(self, model: Any, window: float = 0.005, max_batch_size: int = 32):
+        self.model = model
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._pending: List[tuple] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+    
+    async def submit(self, messages: List[Any]) -> Any:
+        """提交一组消息，等待所在批次完成后返回模型响应"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((messages, future))
+        
+        # 没有其他待处理或进行中的请求时立即分发，单个请求不额外等待窗口时间
+        idle = len(self._pending) == 1 and not self._tasks
+        if idle or len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        
+        return await future
+    
+    def _flush(self):
+        """取出当前批次并在后台分发"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._dispatch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+    
+    async def _dispatch(self, batch: List[tuple]):
+        """批量调用模型并将结果分发给各个等待者"""
+        # 跳过分发前已被取消的调用方
+        batch = [item for item in batch if not item[1].done()]
+        if not batch:
+            return
+        
+        try:
+            results = await self.model.abatch(
+                [messages for messages, _ in batch],
+                return_exceptions=True
+            )
+        except Exception as e:
+            results = [e] * len(batch)
+        
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+_chat_batchers: Dict[str, ChatBatcher] = {}
+
+# 聊天响应缓存：键为 (model, messages) 的哈希，值为模型输出内容
+CHAT_CACHE_TTL = 3600
+REDIS_CHAT_CACHE_PREFIX = b"agentx:langchain:chat:"
+# Redis读写超时（秒），Redis不可达时尽快降级为仅使用本进程缓存
+REDIS_TIMEOUT = 0.5
+_chat_cache: TTLCache = TTLCache(maxsize=10_000, ttl=CHAT_CACHE_TTL)
+# LLM链缓存：键为 (提示模板, 模型名)，有界以免任意模板导致内存增长
+_llm_chain_cache: LRUCache = LRUCache(maxsize=128)
+# 进行中的聊天生成任务（singleflight），并发的相同请求共享同一次模型调用
+_chat_inflight: Dict[bytes, asyncio.Task] = {}
+# 后台进行中的Redis缓存写入任务，保留引用避免任务被垃圾回收
+_redis_write_tasks: set = set()
+
 # 请求/响应模型
+# 请求模型只读且忽略未知字段，校验时不做额外的字符串处理
+REQUEST_MODEL_CONFIG = ConfigDict(
+    str_strip_whitespace=False,
+    validate_assignment=False,
+    frozen=True,
+    extra="ignore"
+)
+
 class ChatRequest(BaseModel):
+    model_config = REQUEST_MODEL_CONFIG
+    
     agent_type: str = "conversational"
     model: str = "gpt-3.5-turbo"
     messages: List[Dict[str, str]]
@@ -84,6 +247,8 @@ class ChatResponse(BaseModel):
     timestamp: str
 
 class ToolRequest(BaseModel):
+    model_config = REQUEST_MODEL_CONFIG
+    
     tool_name: str
     arguments: Dict[str, Any]
     agent_config: Optional[Dict[str, Any]] = None
@@ -93,7 +258,17 @@ class ToolResponse(BaseModel):
     success: bool
     error: Optional[str] = None
 
+# 预构建的响应序列化器，避免每次请求重复构建
+# 热点端点不声明response_model，跳过出站校验，响应结构通过responses参数写入OpenAPI文档
+CHAT_RESPONSE_ADAPTER = TypeAdapter(ChatResponse)
+TOOL_RESPONSE_ADAPTER = TypeAdapter(ToolResponse)
+TOOL_BATCH_RESPONSE_ADAPTER = TypeAdapter(List[ToolResponse])
+# 单次批量工具调用的最大数量，超出时请求校验失败（422）
+MAX_TOOL_BATCH_SIZE = 64
+
 class ChainRequest(BaseModel):
+    model_config = REQUEST_MODEL_CONFIG
+    
     chain_config: Dict[str, Any]
     agent_config: Optional[Dict[str, Any]] = None
     model: str = "gpt-3.5-turbo"
@@ -103,7 +278,11 @@ class ChainResponse(BaseModel):
     success: bool
     error: Optional[str] = None
 
+CHAIN_RESPONSE_ADAPTER = TypeAdapter(ChainResponse)
+
 class AgentCreateRequest(BaseModel):
+    model_config = REQUEST_MODEL_CONFIG
+    
     agent_id: str
     agent_type: str = "conversational"
     model: str = "gpt-3.5-turbo"
@@ -117,6 +296,8 @@ class VersionResponse(BaseModel):
     service_version: str
 
 class PackageCheckRequest(BaseModel):
+    model_config = REQUEST_MODEL_CONFIG
+    
     package: str
 
 class PackageCheckResponse(BaseModel):
@@ -124,6 +305,10 @@ class PackageCheckResponse(BaseModel):
     version: Optional[str] = None
 
 # 工具函数
+def json_response(adapter: TypeAdapter, obj: Any) -> Response:
+    """使用预构建的序列化器直接输出JSON响应"""
+    return Response(content=adapter.dump_json(obj), media_type="application/json")
+
 def get_openai_api_key() -> str:
     """获取OpenAI API密钥"""
     api_key = os.getenv("OPENAI_API_KEY")
@@ -135,27 +320,224 @@ def create_chat_model(model_name: str, **kwargs) -> Any:
     """创建聊天模型"""
     try:
         if model_name.startswith("gpt-"):
-            return ChatOpenAI(
+            api_key = get_openai_api_key()
+            ChatOpenAI = lazy_import("langchain.chat_models", "ChatOpenAI")
+            model = ChatOpenAI(
                 model_name=model_name,
-                openai_api_key=get_openai_api_key(),
+                openai_api_key=api_key,
                 **kwargs
             )
+            # 复用共享连接池，避免每个模型各自建立连接；
+            # 连接参数沿用ChatOpenAI已解析的配置（网关地址、组织、超时、重试、请求头等），配置了代理时不替换
+            if state.http_client is not None and "async_client" not in kwargs and not model.openai_proxy:
+                AsyncOpenAI = lazy_import("openai", "AsyncOpenAI")
+                model.async_client = AsyncOpenAI(
+                    api_key=api_key,
+                    organization=model.openai_organization,
+                    base_url=model.openai_api_base,
+                    timeout=model.request_timeout if model.request_timeout is not None else state.http_client.timeout,
+                    max_retries=model.max_retries,
+                    default_headers=model.default_headers,
+                    default_query=model.default_query,
+                    http_client=state.http_client
+                ).chat.completions
+            return model
         else:
             raise ValueError(f"不支持的模型: {model_name}")
     except Exception as e:
         logger.error(f"创建模型失败: {e}")
         raise HTTPException(status_code=500, detail=f"创建模型失败: {e}")
 
-def create_basic_tools() -> List[Tool]:
+def get_chat_model(model_name: str) -> Any:
+    """获取聊天模型，不存在时创建并注册"""
+    # 检查与写入之间没有await点，在事件循环上是原子的，并发冷启动不会重复创建
+    model = state.models.get(model_name)
+    if model is None:
+        model = create_chat_model(model_name)
+        state.models[model_name] = model
+    return model
+
+def get_chat_batcher(model_name: str) -> ChatBatcher:
+    """获取模型对应的微批处理器"""
+    batcher = _chat_batchers.get(model_name)
+    if batcher is None:
+        batcher = ChatBatcher(get_chat_model(model_name))
+        _chat_batchers[model_name] = batcher
+    return batcher
+
+def get_llm_chain(prompt_template: str, model_name: str) -> Any:
+    """获取可复用的LLM链，不存在时按模板创建"""
+    key = (prompt_template, model_name)
+    chain = _llm_chain_cache.get(key)
+    if chain is None:
+        PromptTemplate = lazy_import("langchain.prompts", "PromptTemplate")
+        LLMChain = lazy_import("langchain.chains", "LLMChain")
+        prompt = PromptTemplate(
+            input_variables=["input"],
+            template=prompt_template
+        )
+        chain = LLMChain(llm=get_chat_model(model_name), prompt=prompt)
+        _llm_chain_cache[key] = chain
+    return chain
+
+def chat_cache_key(request: ChatRequest) -> bytes:
+    """计算聊天请求的缓存键"""
+    payload = orjson.dumps([request.model, request.messages], option=orjson.OPT_SORT_KEYS)
+    return hashlib.blake2b(payload, digest_size=16).digest()
+
+def normalize_prompt_text(text: str) -> str:
+    """规范化提示文本空白，使相同的系统提示逐字节一致以命中服务端前缀缓存"""
+    return "\n".join(line.rstrip() for line in text.strip().splitlines())
+
+@functools.cache
+def chat_message_builders() -> Dict[str, Any]:
+    """消息角色到LangChain消息构造函数的分发表"""
+    HumanMessage = lazy_import("langchain.schema", "HumanMessage")
+    AIMessage = lazy_import("langchain.schema", "AIMessage")
+    SystemMessage = lazy_import("langchain.schema", "SystemMessage")
+    return {
+        "user": lambda content: HumanMessage(content=content),
+        "assistant": lambda content: AIMessage(content=content),
+        "system": lambda content: SystemMessage(content=normalize_prompt_text(content)),
+    }
+
+async def get_cached_chat(cache_key: bytes) -> Optional[str]:
+    """依次查询本进程缓存和Redis共享缓存"""
+    content = _chat_cache.get(cache_key)
+    if content is None and state.redis is not None:
+        try:
+            value = await state.redis.get(REDIS_CHAT_CACHE_PREFIX + cache_key)
+        except Exception as e:
+            logger.warning(f"读取Redis缓存失败: {e}")
+            return None
+        if value is not None:
+            content = orjson.loads(value)
+            _chat_cache[cache_key] = content
+    return content
+
+async def _write_redis_chat(redis: Any, cache_key: bytes, content: str) -> None:
+    """将聊天回复写入Redis共享缓存，失败时只记录日志"""
+    try:
+        await redis.set(
+            REDIS_CHAT_CACHE_PREFIX + cache_key,
+            orjson.dumps(content),
+            ex=CHAT_CACHE_TTL
+        )
+    except Exception as e:
+        logger.warning(f"写入Redis缓存失败: {e}")
+
+def store_cached_chat(cache_key: bytes, content: str) -> None:
+    """写入本进程缓存，并在后台同步到Redis共享缓存，不阻塞响应"""
+    _chat_cache[cache_key] = content
+    if state.redis is not None:
+        task = asyncio.create_task(_write_redis_chat(state.redis, cache_key, content))
+        _redis_write_tasks.add(task)
+        task.add_done_callback(_redis_write_tasks.discard)
+
+async def _generate_and_cache_chat(cache_key: bytes, request: ChatRequest) -> str:
+    """生成聊天回复并写入缓存"""
+    content = await generate_chat_content(request)
+    store_cached_chat(cache_key, content)
+    return content
+
+def _release_chat_inflight(cache_key: bytes, task: asyncio.Task):
+    """生成任务结束后移出进行中表，并取走异常避免无人等待时告警"""
+    _chat_inflight.pop(cache_key, None)
+    if not task.cancelled():
+        task.exception()
+
+async def generate_chat_shared(cache_key: bytes, request: ChatRequest) -> str:
+    """同一缓存键只发起一次模型调用，并发的重复请求等待同一结果"""
+    task = _chat_inflight.get(cache_key)
+    if task is None:
+        task = asyncio.create_task(_generate_and_cache_chat(cache_key, request))
+        _chat_inflight[cache_key] = task
+        task.add_done_callback(functools.partial(_release_chat_inflight, cache_key))
+    # shield避免单个调用方断开连接时取消其他调用方共享的任务
+    return await asyncio.shield(task)
+
+def build_chat_messages(request: ChatRequest) -> List[Any]:
+    """将请求消息转换为LangChain消息"""
+    builders = chat_message_builders()
+    unknown_roles = {msg["role"] for msg in request.messages} - builders.keys()
+    if unknown_roles:
+        raise ValueError(f"不支持的消息角色: {', '.join(sorted(unknown_roles))}")
+    
+    # 系统提示已规范化空白，逐字节一致的前缀可命中OpenAI的自动提示缓存
+    return [builders[msg["role"]](msg["content"]) for msg in request.messages]
+
+async def generate_chat_content(request: ChatRequest) -> str:
+    """调用模型生成聊天回复内容"""
+    batcher = get_chat_batcher(request.model)
+    messages = build_chat_messages(request)
+    
+    # 生成响应（与同一时间窗口内的其他请求合并批量调用）
+    response = await batcher.submit(messages)
+    return response.content
+
+# 计算器支持的运算符
+_CALC_BINARY_OPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Pow: operator.pow,
+}
+_CALC_UNARY_OPS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+# 幂运算指数上限，防止超大数计算耗尽CPU
+_CALC_MAX_EXPONENT = 100
+# 整数结果的位数上限：嵌套幂运算或连乘会绕过指数上限，大整数运算持有GIL会阻塞所有请求
+_CALC_MAX_RESULT_BITS = 4096
+# 删除所有允许字符的转换表，转换后仍有剩余即包含非法字符
+_CALC_ALLOWED_CHARS = "0123456789+-*/.() "
+_CALC_DISALLOWED_TABLE = str.maketrans("", "", _CALC_ALLOWED_CHARS)
+
+def _estimate_result_bits(op: ast.operator, left: Any, right: Any) -> int:
+    """在计算前估算整数乘法和幂运算结果的位数上界"""
+    if not (isinstance(left, int) and isinstance(right, int)):
+        return 0
+    if isinstance(op, ast.Pow) and right > 0:
+        return abs(left).bit_length() * right
+    if isinstance(op, ast.Mult):
+        return abs(left).bit_length() + abs(right).bit_length()
+    return 0
+
+def _eval_calc_node(node: ast.AST) -> Any:
+    """递归计算表达式语法树，仅允许数字和四则/幂运算"""
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        return node.value
+    if isinstance(node, ast.BinOp) and type(node.op) in _CALC_BINARY_OPS:
+        left = _eval_calc_node(node.left)
+        right = _eval_calc_node(node.right)
+        if isinstance(node.op, ast.Pow) and abs(right) > _CALC_MAX_EXPONENT:
+            raise ValueError(f"指数过大: {right}")
+        if _estimate_result_bits(node.op, left, right) > _CALC_MAX_RESULT_BITS:
+            raise ValueError(f"结果过大: 超过{_CALC_MAX_RESULT_BITS}位")
+        return _CALC_BINARY_OPS[type(node.op)](left, right)
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _CALC_UNARY_OPS:
+        return _CALC_UNARY_OPS[type(node.op)](_eval_calc_node(node.operand))
+    raise ValueError(f"不支持的表达式: {type(node).__name__}")
+
+@functools.lru_cache(maxsize=1024)
+def evaluate_expression(expression: str) -> Any:
+    """计算数学表达式，相同表达式的结果会被缓存"""
+    return _eval_calc_node(ast.parse(expression, mode="eval").body)
+
+def create_basic_tools() -> List["Tool"]:
     """创建基础工具"""
+    Tool = lazy_import("langchain.tools", "Tool")
+    
     def calculator(expression: str) -> str:
         """简单计算器工具"""
         try:
             # 安全的数学表达式计算
-            allowed_chars = set("0123456789+-*/.() ")
-            if not all(c in allowed_chars for c in expression):
+            if expression.translate(_CALC_DISALLOWED_TABLE):
                 return "错误: 包含不允许的字符"
-            result = eval(expression)
+            result = evaluate_expression(expression)
             return str(result)
         except Exception as e:
             return f"计算错误: {e}"
@@ -186,15 +568,44 @@ def create_basic_tools() -> List[Tool]:
         )
     ]
 
+# 健康检查响应缓存：(初始化状态, 时间字符串, 响应体)
+_health_cache: tuple = (None, "", b"")
+
+def health_body() -> bytes:
+    """获取健康检查响应体，仅在初始化状态或时间字符串变化时重新生成"""
+    global _health_cache
+    timestamp = current_timestamp()
+    initialized, cached_timestamp, body = _health_cache
+    if initialized is not state.initialized or cached_timestamp != timestamp:
+        body = orjson.dumps({
+            "status": "healthy",
+            "timestamp": timestamp,
+            "initialized": state.initialized
+        })
+        _health_cache = (state.initialized, timestamp, body)
+    return body
+
+class HealthEndpoint:
+    """健康检查原生ASGI端点，绕过FastAPI的依赖注入和校验"""
+    async def __call__(self, scope, receive, send):
+        body = health_body()
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+def ensure_basic_tools():
+    """确保当前进程已注册基础工具，多worker时每个进程各自注册"""
+    if not state.tools:
+        state.tools.update({tool.name: tool for tool in create_basic_tools()})
+
 # API端点
-@app.get("/health")
-async def health_check():
-    """健康检查"""
-    return {
-        "status": "healthy",
-        "timestamp": datetime.now().isoformat(),
-        "initialized": state.initialized
-    }
+app.router.routes.append(Route("/health", endpoint=HealthEndpoint(), methods=["GET"]))
 
 @app.get("/version", response_model=VersionResponse)
 async def get_version():
@@ -224,14 +635,13 @@ async def initialize_service():
         logger.info("初始化LangChain服务...")
         
         # 创建基础工具
-        state.tools.update({tool.name: tool for tool in create_basic_tools()})
+        ensure_basic_tools()
         
         # 预加载常用模型
         common_models = ["gpt-3.5-turbo"]
         for model_name in common_models:
             try:
-                model = create_chat_model(model_name)
-                state.models[model_name] = model
+                get_chat_model(model_name)
                 logger.info(f"预加载模型: {model_name}")
             except Exception as e:
                 logger.warning(f"预加载模型 {model_name} 失败: {e}")
@@ -244,48 +654,72 @@ async def initialize_service():
         logger.error(f"初始化失败: {e}")
         raise HTTPException(status_code=500, detail=f"初始化失败: {e}")
 
-@app.post("/chat", response_model=ChatResponse)
+@app.post("/chat", response_model=None, responses={200: {"model": ChatResponse}})
 async def chat(request: ChatRequest):
     """处理聊天请求"""
     try:
         logger.info(f"处理聊天请求: {request.model}")
         
-        # 获取或创建模型
-        if request.model not in state.models:
-            state.models[request.model] = create_chat_model(request.model)
-        
-        model = state.models[request.model]
-        
-        # 构建消息
-        messages = []
-        for msg in request.messages:
-            if msg["role"] == "user":
-                messages.append(HumanMessage(content=msg["content"]))
-            elif msg["role"] == "assistant":
-                messages.append(AIMessage(content=msg["content"]))
-            elif msg["role"] == "system":
-                messages.append(SystemMessage(content=msg["content"]))
+        cache_key = chat_cache_key(request)
+        # 依次尝试：响应缓存 -> 进行中的相同请求 -> 调用模型
+        content = await get_cached_chat(cache_key)
+        if content is None:
+            content = await generate_chat_shared(cache_key, request)
         
-        # 生成响应
-        response = model(messages)
-        
-        return ChatResponse(
-            content=response.content,
+        # 热路径跳过出站模型校验，直接用预构建的序列化器输出
+        return json_response(CHAT_RESPONSE_ADAPTER, ChatResponse.model_construct(
+            content=content,
             model=request.model,
-            timestamp=datetime.now().isoformat()
-        )
+            timestamp=current_timestamp()
+        ))
     except Exception as e:
         logger.error(f"聊天处理失败: {e}")
         raise HTTPException(status_code=500, detail=f"聊天处理失败: {e}")
 
-@app.post("/tool", response_model=ToolResponse)
-async def call_tool(request: ToolRequest):
-    """调用工具"""
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """流式处理聊天请求，以NDJSON逐块返回增量内容"""
+    try:
+        logger.info(f"处理流式聊天请求: {request.model}")
+        
+        cache_key = chat_cache_key(request)
+        cached = await get_cached_chat(cache_key)
+        # 模型和消息在开始输出前构建，创建失败时仍能返回HTTP错误
+        if cached is None:
+            model = get_chat_model(request.model)
+            messages = build_chat_messages(request)
+    except Exception as e:
+        logger.error(f"流式聊天处理失败: {e}")
+        raise HTTPException(status_code=500, detail=f"流式聊天处理失败: {e}")
+    
+    async def generate():
+        if cached is not None:
+            yield orjson.dumps({"delta": cached}) + b"\n"
+            return
+        
+        chunks = []
+        try:
+            async for chunk in model.astream(messages):
+                chunks.append(chunk.content)
+                yield orjson.dumps({"delta": chunk.content}) + b"\n"
+        except Exception as e:
+            logger.error(f"流式聊天处理失败: {e}")
+            yield orjson.dumps({"error": str(e)}) + b"\n"
+            return
+        
+        # 完整输出写入响应缓存，供后续相同请求直接命中
+        store_cached_chat(cache_key, "".join(chunks))
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+async def run_tool(request: ToolRequest) -> ToolResponse:
+    """执行单个工具调用，失败时返回错误结果而不抛出异常"""
     try:
         logger.info(f"调用工具: {request.tool_name}")
         
+        ensure_basic_tools()
         if request.tool_name not in state.tools:
-            return ToolResponse(
+            return ToolResponse.model_construct(
                 result=None,
                 success=False,
                 error=f"工具 '{request.tool_name}' 不存在"
@@ -298,77 +732,92 @@ async def call_tool(request: ToolRequest):
             # 单参数工具
             input_value = list(request.arguments.values())[0]
         else:
-            # 多参数工具，转换为字符串
-            input_value = json.dumps(request.arguments)
+            # 多参数工具，转换为字符串；orjson不支持超过64位的整数，此时回退到标准库
+            try:
+                input_value = orjson.dumps(request.arguments).decode()
+            except orjson.JSONEncodeError:
+                input_value = json.dumps(request.arguments)
         
-        # 调用工具
-        result = tool.func(input_value)
+        # 调用工具：支持异步的工具直接await，同步工具放到线程中执行
+        if tool.coroutine is not None:
+            result = await tool.coroutine(input_value)
+        else:
+            result = await asyncio.to_thread(tool.func, input_value)
         
-        return ToolResponse(
+        return ToolResponse.model_construct(
             result=result,
             success=True
         )
     except Exception as e:
         logger.error(f"工具调用失败: {e}")
-        return ToolResponse(
+        return ToolResponse.model_construct(
             result=None,
             success=False,
             error=str(e)
         )
 
-@app.post("/chain", response_model=ChainResponse)
+@app.post("/tool", response_model=None, responses={200: {"model": ToolResponse}})
+async def call_tool(request: ToolRequest):
+    """调用工具"""
+    return json_response(TOOL_RESPONSE_ADAPTER, await run_tool(request))
+
+@app.post("/tool/batch", response_model=None, responses={200: {"model": List[ToolResponse]}})
+async def call_tools_batch(requests: Annotated[List[ToolRequest], Field(max_length=MAX_TOOL_BATCH_SIZE)]):
+    """批量并发调用工具，结果顺序与请求一致"""
+    logger.info(f"批量调用工具: {len(requests)}个")
+    results = await asyncio.gather(*[run_tool(request) for request in requests])
+    return json_response(TOOL_BATCH_RESPONSE_ADAPTER, results)
+
+@app.post("/chain", response_model=None, responses={200: {"model": ChainResponse}})
 async def execute_chain(request: ChainRequest):
     """执行LangChain链"""
     try:
         logger.info("执行LangChain链")
         
         # 获取模型
-        if request.model not in state.models:
-            state.models[request.model] = create_chat_model(request.model)
-        
-        model = state.models[request.model]
+        model = get_chat_model(request.model)
         
         # 根据链配置创建链
         chain_type = request.chain_config.get("type", "llm")
         
         if chain_type == "llm":
-            # 简单LLM链
+            # 简单LLM链，无状态，按模板和模型复用
             prompt_template = request.chain_config.get("prompt", "{input}")
-            prompt = PromptTemplate(
-                input_variables=["input"],
-                template=prompt_template
-            )
-            chain = LLMChain(llm=model, prompt=prompt)
+            chain = get_llm_chain(prompt_template, request.model)
             
             input_data = request.chain_config.get("input", "")
-            result = chain.run(input=input_data)
+            outputs = await chain.ainvoke({"input": input_data})
+            result = outputs[chain.output_key]
         
         elif chain_type == "conversation":
             # 对话链
+            ConversationBufferMemory = lazy_import("langchain.memory", "ConversationBufferMemory")
+            ConversationChain = lazy_import("langchain.chains", "ConversationChain")
             memory = ConversationBufferMemory()
             chain = ConversationChain(llm=model, memory=memory)
             
             input_data = request.chain_config.get("input", "")
-            result = chain.run(input=input_data)
+            outputs = await chain.ainvoke({"input": input_data})
+            result = outputs[chain.output_key]
         
         else:
-            return ChainResponse(
+            return json_response(CHAIN_RESPONSE_ADAPTER, ChainResponse.model_construct(
                 result=None,
                 success=False,
                 error=f"不支持的链类型: {chain_type}"
-            )
+            ))
         
-        return ChainResponse(
+        return json_response(CHAIN_RESPONSE_ADAPTER, ChainResponse.model_construct(
             result=result,
             success=True
-        )
+        ))
     except Exception as e:
         logger.error(f"链执行失败: {e}")
-        return ChainResponse(
+        return json_response(CHAIN_RESPONSE_ADAPTER, ChainResponse.model_construct(
             result=None,
             success=False,
             error=str(e)
-        )
+        ))
 
 @app.post("/agent/create")
 async def create_agent(request: AgentCreateRequest):
@@ -377,14 +826,12 @@ async def create_agent(request: AgentCreateRequest):
         logger.info(f"创建Agent: {request.agent_id}")
         
         # 获取模型
-        if request.model not in state.models:
-            state.models[request.model] = create_chat_model(request.model)
-        
-        model = state.models[request.model]
+        model = get_chat_model(request.model)
         
         # 创建Agent
         if request.agent_type == "conversational":
             # 对话型Agent
+            ConversationBufferMemory = lazy_import("langchain.memory", "ConversationBufferMemory")
             memory = ConversationBufferMemory()
             agent_data = {
                 "type": "conversational",
@@ -396,6 +843,9 @@ async def create_agent(request: AgentCreateRequest):
         
         elif request.agent_type == "tool_using":
             # 工具使用Agent
+            initialize_agent = lazy_import("langchain.agents", "initialize_agent")
+            AgentType = lazy_import("langchain.agents", "AgentType")
+            ensure_basic_tools()
             tools = [state.tools[tool_name] for tool_name in (request.tools or []) if tool_name in state.tools]
             agent = initialize_agent(
                 tools=tools,
@@ -446,9 +896,8 @@ async def preload_model(request: dict):
         if not model_name:
             raise HTTPException(status_code=400, detail="缺少model参数")
         
-        if model_name not in state.models:
-            state.models[model_name] = create_chat_model(model_name)
-            logger.info(f"预加载模型: {model_name}")
+        get_chat_model(model_name)
+        logger.info(f"预加载模型: {model_name}")
         
         return {"success": True, "model": model_name}
     except Exception as e:
@@ -464,6 +913,7 @@ async def preload_tool(request: dict):
             raise HTTPException(status_code=400, detail="缺少tool参数")
         
         # 工具已在初始化时加载
+        ensure_basic_tools()
         if tool_name in state.tools:
             logger.info(f"工具已存在: {tool_name}")
         else:
@@ -482,20 +932,35 @@ def main():
     parser.add_argument("--host", default="127.0.0.1", help="服务器主机")
     parser.add_argument("--port", type=int, default=8000, help="服务器端口")
     parser.add_argument("--log-level", default="info", help="日志级别")
+    parser.add_argument("--workers", type=int, default=1, help="工作进程数")
+    parser.add_argument("--redis-url", default=None, help="多worker共享聊天缓存的Redis地址")
     
     args = parser.parse_args()
     
+    # worker进程重新导入模块，配置通过环境变量传递
+    if args.redis_url:
+        if importlib.util.find_spec("redis") is None:
+            print("错误: 使用 --redis-url 需要安装可选依赖: pip install 'redis>=5.0.1'")
+            sys.exit(1)
+        os.environ["AGENTX_REDIS_URL"] = args.redis_url
+    if args.workers > 1:
+        logger.warning("多worker模式下Agent和模型实例按进程隔离，仅聊天缓存通过Redis共享")
+    
     # 设置日志级别
     logging.getLogger().setLevel(getattr(logging, args.log_level.upper()))
     
-    logger.info(f"启动AgentX LangChain服务在 {args.host}:{args.port}")
+    logger.info(f"启动AgentX LangChain服务在 {args.host}:{args.port} (workers={args.workers})")
     
-    # 启动服务器
+    # 启动服务器，显式使用uvloop和httptools（需要 uvicorn[standard]），缺少时直接报错
+    # 多进程模式下uvicorn需要以导入字符串的形式加载应用
     uvicorn.run(
-        app,
+        "agentx_langchain_service:app" if args.workers > 1 else app,
         host=args.host,
         port=args.port,
-        log_level=args.log_level
+        log_level=args.log_level,
+        workers=args.workers,
+        loop="uvloop",
+        http="httptools"
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,57 @@
+"""
+计算器工具测试
+"""
+
+import ast
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agentx_langchain_service import _estimate_result_bits, create_basic_tools, evaluate_expression
+
+
+def calculator(expression: str) -> str:
+    tools = {tool.name: tool for tool in create_basic_tools()}
+    return tools["calculator"].func(expression)
+
+
+def test_basic_arithmetic():
+    """测试基本四则运算"""
+    assert evaluate_expression("1+2*3") == 7
+    assert evaluate_expression("(1+2)/4") == 0.75
+    assert evaluate_expression("-3 // 2") == -2
+    assert evaluate_expression("2**10") == 1024
+
+
+def test_disallowed_characters():
+    """测试非法字符被拒绝"""
+    assert calculator("__import__('os')") == "错误: 包含不允许的字符"
+
+
+def test_result_size_upper_bound():
+    """测试位数估算是结果的上界"""
+    for left, right in [(3, 100), (2 ** 41 - 1, 100), (99, 99)]:
+        assert _estimate_result_bits(ast.Pow(), left, right) >= (left ** right).bit_length()
+        assert _estimate_result_bits(ast.Mult(), left, right) >= (left * right).bit_length()
+    # 实际结果为4100位，超过4096位上限
+    with pytest.raises(ValueError, match="结果过大"):
+        evaluate_expression("(2**41-1)**100")
+
+
+def test_exponent_limit():
+    """测试指数上限"""
+    with pytest.raises(ValueError):
+        evaluate_expression("2**9999")
+
+
+@pytest.mark.parametrize("expression", [
+    "((((9**99)**99)**99)**99)",
+    "(9**99)**99",
+    "(99**99)*(99**99)*(99**99)*(99**99)*(99**99)*(99**99)*(99**99)*(99**99)*(99**99)*(99**99)*(99**99)*(99**99)*(99**99)*(99**99)*(99**99)*(99**99)",
+])
+def test_result_size_limit(expression):
+    """测试嵌套幂运算和连乘不能绕过结果大小限制"""
+    assert calculator(expression).startswith("计算错误: 结果过大")
@@ -0,0 +1,98 @@
+"""
+聊天微批处理测试
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agentx_langchain_service import ChatBatcher
+
+
+class StubModel:
+    """记录每次批量调用的输入，输入为 "fail" 时返回异常"""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = []
+
+    async def abatch(self, inputs, return_exceptions=False):
+        self.calls.append(list(inputs))
+        await asyncio.sleep(self.delay)
+        return [ValueError(item) if item == "fail" else f"reply:{item}" for item in inputs]
+
+
+def test_single_request_dispatched_immediately():
+    """测试空闲时单个请求不等待批处理窗口"""
+    async def main():
+        model = StubModel()
+        batcher = ChatBatcher(model, window=10.0)
+        return model, await asyncio.wait_for(batcher.submit("a"), timeout=1.0)
+
+    model, result = asyncio.run(main())
+    assert result == "reply:a"
+    assert model.calls == [["a"]]
+
+
+def test_failure_isolated_within_batch():
+    """测试批次中单个请求失败不影响其他请求"""
+    async def main():
+        model = StubModel(delay=0.01)
+        batcher = ChatBatcher(model, window=0.01)
+        first = asyncio.create_task(batcher.submit("first"))
+        await asyncio.sleep(0)
+        # 第一个请求进行中时提交的请求合并为一个批次
+        rest = await asyncio.gather(
+            batcher.submit("a"), batcher.submit("fail"), batcher.submit("b"),
+            return_exceptions=True
+        )
+        return model, await first, rest
+
+    model, first, (a, failed, b) = asyncio.run(main())
+    assert first == "reply:first"
+    assert (a, b) == ("reply:a", "reply:b")
+    assert isinstance(failed, ValueError)
+    assert model.calls == [["first"], ["a", "fail", "b"]]
+
+
+def test_flush_at_max_batch_size():
+    """测试待处理请求达到批次上限时立即分发，不等待窗口"""
+    async def main():
+        model = StubModel(delay=0.01)
+        batcher = ChatBatcher(model, window=10.0, max_batch_size=3)
+        first = asyncio.create_task(batcher.submit("first"))
+        await asyncio.sleep(0)
+        rest = await asyncio.wait_for(
+            asyncio.gather(*(batcher.submit(str(i)) for i in range(3))),
+            timeout=1.0
+        )
+        return model, await first, rest
+
+    model, first, rest = asyncio.run(main())
+    assert first == "reply:first"
+    assert rest == ["reply:0", "reply:1", "reply:2"]
+    assert model.calls == [["first"], ["0", "1", "2"]]
+
+
+def test_cancelled_caller_not_dispatched():
+    """测试分发前已取消的调用方不会发送给模型，其他请求照常返回"""
+    async def main():
+        model = StubModel(delay=0.01)
+        batcher = ChatBatcher(model, window=0.01)
+        first = asyncio.create_task(batcher.submit("first"))
+        await asyncio.sleep(0)
+        cancelled = asyncio.create_task(batcher.submit("cancelled"))
+        kept = asyncio.create_task(batcher.submit("kept"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        return model, await first, await kept
+
+    model, first, kept = asyncio.run(main())
+    assert (first, kept) == ("reply:first", "reply:kept")
+    assert model.calls == [["first"], ["kept"]]
@@ -0,0 +1,86 @@
+"""
+聊天请求合并（singleflight）测试
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import agentx_langchain_service as service
+from agentx_langchain_service import ChatRequest, generate_chat_shared
+
+CACHE_KEY = b"singleflight-test"
+REQUEST = ChatRequest(messages=[{"role": "user", "content": "hello"}])
+
+
+@pytest.fixture
+def model_calls(monkeypatch):
+    """替换模型调用，记录调用次数；设置 error 后调用抛出该异常"""
+    calls = {"count": 0, "error": None}
+
+    async def fake_generate(request):
+        calls["count"] += 1
+        await asyncio.sleep(0.01)
+        if calls["error"] is not None:
+            raise calls["error"]
+        return "shared reply"
+
+    monkeypatch.setattr(service, "generate_chat_content", fake_generate)
+    monkeypatch.setattr(service.state, "redis", None)
+    service._chat_cache.clear()
+    service._chat_inflight.clear()
+    yield calls
+    service._chat_cache.clear()
+    service._chat_inflight.clear()
+
+
+def test_concurrent_requests_share_one_call(model_calls):
+    """测试并发的相同请求只调用一次模型"""
+    async def main():
+        results = await asyncio.gather(*(generate_chat_shared(CACHE_KEY, REQUEST) for _ in range(5)))
+        return results, dict(service._chat_inflight)
+
+    results, inflight = asyncio.run(main())
+    assert results == ["shared reply"] * 5
+    assert model_calls["count"] == 1
+    assert inflight == {}
+    assert service._chat_cache[CACHE_KEY] == "shared reply"
+
+
+def test_exception_reaches_every_waiter(model_calls):
+    """测试模型调用异常传递给所有等待者，且不写入缓存"""
+    model_calls["error"] = RuntimeError("model down")
+
+    async def main():
+        results = await asyncio.gather(
+            *(generate_chat_shared(CACHE_KEY, REQUEST) for _ in range(3)),
+            return_exceptions=True
+        )
+        return results, dict(service._chat_inflight)
+
+    results, inflight = asyncio.run(main())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert model_calls["count"] == 1
+    assert inflight == {}
+    assert CACHE_KEY not in service._chat_cache
+
+
+def test_cancelling_first_caller_keeps_shared_task(model_calls):
+    """测试取消第一个调用方不会取消其他调用方共享的任务"""
+    async def main():
+        first = asyncio.create_task(generate_chat_shared(CACHE_KEY, REQUEST))
+        second = asyncio.create_task(generate_chat_shared(CACHE_KEY, REQUEST))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second, dict(service._chat_inflight)
+
+    result, inflight = asyncio.run(main())
+    assert result == "shared reply"
+    assert model_calls["count"] == 1
+    assert inflight == {}
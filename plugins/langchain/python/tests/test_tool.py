@@ -0,0 +1,26 @@
+"""
+工具调用测试
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agentx_langchain_service import ToolRequest, run_tool
+
+
+def test_multi_argument_big_integer():
+    """测试多参数中超过64位的整数不会导致序列化失败"""
+    big = 123456789012345678901234567890
+    response = asyncio.run(run_tool(ToolRequest(tool_name="search", arguments={"a": big, "b": 1})))
+    assert response.success, response.error
+    assert str(big) in response.result
+
+
+def test_unknown_tool():
+    """测试调用不存在的工具返回错误结果"""
+    response = asyncio.run(run_tool(ToolRequest(tool_name="missing", arguments={})))
+    assert not response.success
+    assert "missing" in response.error